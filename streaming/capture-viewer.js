@@ -15,25 +15,56 @@ const VIEWER_URL = process.env.SPECTATOR_URL || 'http://minecraft-spectator-bot:
 const DISPLAY = process.env.DISPLAY || ':99';
 const WIDTH = parseInt(process.env.DISPLAY_WIDTH || '1280');
 const HEIGHT = parseInt(process.env.DISPLAY_HEIGHT || '720');
+// Set by streaming-service.py when a DRI render node is available
+const USE_GPU = process.env.VIEWER_GPU === 'true';
+// 'screencast': headless browser, JPEG frames written to stdout for FFmpeg
+// (no Xvfb/x11grab). stdout then carries video, so logs go to stderr.
+const SCREENCAST = process.env.CAPTURE_METHOD === 'screencast';
+if (SCREENCAST) {
+  console.log = console.error;
+}
+
+// Pipe screencast frames to stdout, dropping frames while FFmpeg is behind
+async function startScreencast(page) {
+  const client = await page.target().createCDPSession();
+  let backpressure = false;
+  process.stdout.on('drain', () => { backpressure = false; });
+  process.stdout.on('error', () => {}); // FFmpeg restarts are handled by streaming-service.py
+
+  client.on('Page.screencastFrame', ({ data, sessionId }) => {
+    if (!backpressure) {
+      backpressure = !process.stdout.write(Buffer.from(data, 'base64'));
+    }
+    client.send('Page.screencastFrameAck', { sessionId }).catch(() => {});
+  });
+
+  await client.send('Page.startScreencast', {
+    format: 'jpeg',
+    quality: 90,
+    maxWidth: WIDTH,
+    maxHeight: HEIGHT,
+  });
+}
 
 async function captureViewer() {
   console.log('Starting Puppeteer to capture viewer...');
-  console.log(`Display: ${DISPLAY}, Size: ${WIDTH}x${HEIGHT}, URL: ${VIEWER_URL}`);
+  console.log(`Display: ${DISPLAY}, Size: ${WIDTH}x${HEIGHT}, URL: ${VIEWER_URL}, GPU: ${USE_GPU}`);
   
   try {
     // Launch browser in non-headless mode so FFmpeg can capture it via x11grab
     console.log('Launching Chromium browser...');
   const browser = await puppeteer.launch({
       executablePath: process.env.PUPPETEER_EXECUTABLE_PATH || '/usr/bin/chromium',
-      headless: false, // Must be false for x11grab to capture
+      headless: SCREENCAST ? 'new' : false, // Must be false for x11grab to capture
       // Remove the "Chrome is being controlled" infobar
       ignoreDefaultArgs: ['--enable-automation'],
     args: [
       '--no-sandbox',
       '--disable-setuid-sandbox',
       '--disable-dev-shm-usage',
-      '--disable-gpu',
-      `--display=${DISPLAY}`,
+      // Hardware WebGL for prismarine-viewer when a GPU is passed through
+      ...(USE_GPU ? ['--enable-gpu', '--ignore-gpu-blocklist', '--use-gl=egl'] : ['--disable-gpu']),
+      ...(SCREENCAST ? [] : [`--display=${DISPLAY}`]),
         `--window-size=${WIDTH},${HEIGHT}`,
         '--start-maximized',
         '--kiosk', // Fullscreen mode
@@ -71,7 +102,13 @@ async function captureViewer() {
     await page.goto(VIEWER_URL, { waitUntil: 'networkidle0', timeout: 60000 });
   
     console.log('Viewer loaded successfully');
-    console.log('Browser window open for FFmpeg capture via x11grab');
+    if (SCREENCAST) {
+      await startScreencast(page);
+      console.log('Screencast frames streaming to stdout');
+    } else {
+      console.log('Browser window open for FFmpeg capture via x11grab');
+    }
+    console.log('READY'); // Readiness marker for streaming-service.py
     
     // Try to enable any audio (for future when prismarine-viewer adds audio)
     await page.evaluate(() => {
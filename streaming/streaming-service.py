@@ -5,13 +5,30 @@ Minecraft Streaming Service - Optimized for Intel iGPU
 
 import subprocess
 import time
-import requests
+import functools
+import http.client
+import itertools
 import os
+import re
 import signal
+import select
+import selectors
+import shlex
+import shutil
+import socket
 import sys
 import logging
 import threading
+import xcffib
+import xcffib.xproto
+from dataclasses import dataclass
 from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    import zmq  # Optional: push overlay text to FFmpeg instead of per-frame file reloads
+except ImportError:
+    zmq = None
 
 # Logging setup
 log_dir = Path('/app/logs')
@@ -26,6 +43,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _env_number(name, default, cast=int, positive=False):
+    """Parse a numeric env var, exiting with a logged error instead of a bare traceback"""
+    value = os.getenv(name, default)
+    try:
+        number = cast(value)
+    except ValueError:
+        logger.error(f'{name} must be a number, got {value!r}')
+        sys.exit(1)
+    if positive and number <= 0:
+        logger.error(f'{name} must be greater than 0, got {value!r}')
+        sys.exit(1)
+    return number
+
 # Configuration
 SPECTATOR_URL = os.getenv('SPECTATOR_URL', 'http://minecraft-spectator-bot:3000')
 YOUTUBE_STREAM_KEY = os.getenv('YOUTUBE_STREAM_KEY')
@@ -39,27 +69,53 @@ YOUTUBE_HLS_URL = os.getenv('YOUTUBE_HLS_URL')
 YOUTUBE_VIDEO_BITRATE = os.getenv('YOUTUBE_VIDEO_BITRATE', '2500k')
 YOUTUBE_MAXRATE = os.getenv('YOUTUBE_MAXRATE', YOUTUBE_VIDEO_BITRATE)
 YOUTUBE_BUFSIZE = os.getenv('YOUTUBE_BUFSIZE', '5000k')
-YOUTUBE_OUTPUT_WIDTH = int(os.getenv('YOUTUBE_OUTPUT_WIDTH', '1280'))
-YOUTUBE_OUTPUT_HEIGHT = int(os.getenv('YOUTUBE_OUTPUT_HEIGHT', '720'))
-YOUTUBE_FRAMERATE = int(os.getenv('YOUTUBE_FRAMERATE', '30'))
-DISPLAY_WIDTH = int(os.getenv('DISPLAY_WIDTH', '1280'))
-DISPLAY_HEIGHT = int(os.getenv('DISPLAY_HEIGHT', '720'))
+YOUTUBE_OUTPUT_WIDTH = _env_number('YOUTUBE_OUTPUT_WIDTH', '1280', positive=True)
+YOUTUBE_OUTPUT_HEIGHT = _env_number('YOUTUBE_OUTPUT_HEIGHT', '720', positive=True)
+YOUTUBE_FRAMERATE = _env_number('YOUTUBE_FRAMERATE', '30', positive=True)
+DISPLAY_WIDTH = _env_number('DISPLAY_WIDTH', '1280', positive=True)
+DISPLAY_HEIGHT = _env_number('DISPLAY_HEIGHT', '720', positive=True)
 
 # Encoding
 USE_HARDWARE_ENCODING = os.getenv('USE_HARDWARE_ENCODING', 'true').lower() == 'true'
 VAAPI_DEVICE = os.getenv('VAAPI_DEVICE', '/dev/dri/renderD128')
+AMD_VAAPI_DEVICE = '/dev/dri/renderD129'
+NVIDIA_DEVICE = '/dev/nvidia0'
 ENCODER_PRESET = os.getenv('ENCODER_PRESET', 'faster')
 
+# Render prismarine-viewer with hardware WebGL when a DRI render node is available
+VIEWER_GPU = os.getenv('VIEWER_GPU', 'false').lower() == 'true'
+
+# FFmpeg logging: errors only by default; LOG_FFMPEG=true writes verbose output
+# to /app/logs/ffmpeg.log and progress to the service log
+LOG_FFMPEG = os.getenv('LOG_FFMPEG', 'false').lower() == 'true'
+if LOG_FFMPEG:
+    FFMPEG_GLOBAL_ARGS = ['-hide_banner', '-nostats', '-loglevel', 'info',
+                          '-progress', 'pipe:1', '-stats_period', '10']
+else:
+    FFMPEG_GLOBAL_ARGS = ['-hide_banner', '-nostats', '-loglevel', 'error']
+
+# Capture: x11grab (Xvfb) or screencast (headless Chromium piping JPEG frames
+# into FFmpeg, no Xvfb)
+CAPTURE_METHOD = os.getenv('CAPTURE_METHOD', 'x11grab').lower()
+SCREENCAST = CAPTURE_METHOD == 'screencast'
+
 # Audio/Music
 MUSIC_DIR = os.getenv('MUSIC_DIR', '/app/music')
 ENABLE_MUSIC = os.getenv('ENABLE_MUSIC', 'true').lower() == 'true'
-MUSIC_VOLUME = float(os.getenv('MUSIC_VOLUME', '0.3'))
+MUSIC_VOLUME = _env_number('MUSIC_VOLUME', '0.3', float)
 
 # Overlay (reads from shared volume with bot)
 ENABLE_OVERLAY = os.getenv('ENABLE_OVERLAY', 'true').lower() == 'true'
-OVERLAY_FONT_SIZE = int(os.getenv('OVERLAY_FONT_SIZE', '28'))
+OVERLAY_FONT_SIZE = _env_number('OVERLAY_FONT_SIZE', '28', positive=True)
 OVERLAY_POSITION = os.getenv('OVERLAY_POSITION', 'top-left')
+OVERLAY_XY = {
+    'top-left': 'x=30:y=30',
+    'top-right': 'x=w-tw-30:y=30',
+    'bottom-left': 'x=30:y=h-th-30',
+    'bottom-right': 'x=w-tw-30:y=h-th-30',
+}.get(OVERLAY_POSITION, 'x=30:y=30')
 TARGET_FILE = '/app/shared/current_target.txt'  # Shared with bot container
+OVERLAY_ZMQ_ADDRESS = 'tcp://127.0.0.1:5555'  # Loopback only: the filter's default binds every interface
 STREAM_STATUS_FILE = '/app/shared/stream_status.txt'  # "active" or "paused"
 
 # Build stream URL
@@ -86,54 +142,212 @@ else:
     logger.error(f'Unknown platform: {STREAM_PLATFORM}')
     sys.exit(1)
 
+USE_HLS = STREAM_PLATFORM == 'youtube' and YOUTUBE_INGEST_METHOD == 'hls'
+
+# CPU layout: Xvfb/Chromium on the first two cores, FFmpeg on the rest
+_cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+if len(_cpus) >= 4:
+    CAPTURE_CPUS = set(_cpus[:2])
+    ENCODER_CPUS = set(_cpus[2:])
+else:
+    CAPTURE_CPUS = ENCODER_CPUS = None
+
 ffmpeg_process = None
+ffmpeg_started = 0
 xvfb_process = None
 puppeteer_process = None
 
+def _spawn(args, **kwargs):
+    """Popen on CPython's posix_spawn (vfork) path instead of fork+exec, so restarts
+    don't copy the service's page tables. That path needs an absolute executable and
+    close_fds=False, which is safe here: Python creates every fd non-inheritable."""
+    return subprocess.Popen([shutil.which(args[0]) or args[0], *args[1:]], close_fds=False, **kwargs)
+
+_priority_warned = False
+
+def _pin_process(proc, cpus, realtime=False):
+    """Pin a child to a CPU set and optionally raise its priority (needs CAP_SYS_NICE).
+    SCHED_FIFO is only used on reserved cores: unpinned, a real-time encoder would starve
+    Xvfb and Chromium, so it gets nice -10 instead. Set right after spawn so FFmpeg's
+    worker threads inherit it."""
+    global _priority_warned
+    if cpus:
+        try:
+            os.sched_setaffinity(proc.pid, cpus)
+        except OSError as e:
+            logger.warning(f'Could not set CPU affinity for PID {proc.pid}: {e}')
+    if not realtime:
+        return
+    if cpus:
+        try:
+            os.sched_setscheduler(proc.pid, os.SCHED_FIFO, os.sched_param(10))
+            return
+        except OSError:
+            pass
+    try:
+        os.setpriority(os.PRIO_PROCESS, proc.pid, -10)
+    except OSError as e:
+        # Same on every restart; without CAP_SYS_NICE this is expected, so say it once
+        if not _priority_warned:
+            logger.warning(f'Could not raise FFmpeg priority (needs cap_add: SYS_NICE): {e}')
+            _priority_warned = True
+
+# One X connection is kept open for window checks and reopened if Xvfb goes away
+_xconn = None
+
+def _x_root():
+    global _xconn
+    if _xconn is None:
+        _xconn = xcffib.connect(display=':99')
+    return _xconn.get_setup().roots[0].root
+
+def _drop_x_connection():
+    global _xconn
+    if _xconn is not None:
+        try:
+            _xconn.disconnect()
+        except:
+            pass
+        _xconn = None
+
 def _has_x_windows():
     try:
-        out = subprocess.check_output(
-            ['xwininfo', '-root', '-tree'],
-            env={**os.environ, 'DISPLAY': ':99'},
-            stderr=subprocess.STDOUT,
-            text=True,
-            timeout=5
-        )
-        return '0 children.' not in out
+        root = _x_root()
+        return len(_xconn.core.QueryTree(root).reply().children) > 0
     except:
+        _drop_x_connection()
         return False
 
-def wait_for_x_windows(timeout=90):
-    start = time.time()
-    while time.time() - start < timeout:
-        if _has_x_windows():
+def _wait_for_map(deadline):
+    """Wait for a top-level window to appear, woken by X events instead of polling"""
+    root = _x_root()
+    event_mask = xcffib.xproto.CW.EventMask
+    _xconn.core.ChangeWindowAttributes(
+        root, event_mask, [xcffib.xproto.EventMask.SubstructureNotify], is_checked=True).check()
+    try:
+        # Subscribed before looking, so a window mapped in between still wakes us
+        if _xconn.core.QueryTree(root).reply().children:
             return True
-        time.sleep(1)
+        fd = _xconn.get_file_descriptor()
+        while True:
+            event = _xconn.poll_for_event()
+            while event is not None:
+                if isinstance(event, (xcffib.xproto.MapNotifyEvent, xcffib.xproto.CreateNotifyEvent)):
+                    return True
+                event = _xconn.poll_for_event()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            select.select([fd], [], [], remaining)
+    finally:
+        # Unsubscribe so events don't queue up on the shared connection between waits
+        _xconn.core.ChangeWindowAttributes(root, event_mask, [xcffib.xproto.EventMask.NoEvent])
+        _xconn.flush()
+        while _xconn.poll_for_event() is not None:
+            pass
+
+def wait_for_x_windows(timeout=90):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return _wait_for_map(deadline)
+        except:
+            # Xvfb not up yet or the connection dropped; retry on a fresh one
+            _drop_x_connection()
+            time.sleep(0.5)
     return False
 
+def _port_open(url):
+    """Cheap TCP connect check so the HTTP probe only runs once something is listening"""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    try:
+        socket.create_connection((parts.hostname, port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
 def wait_for_service(url, name, timeout=300):
     logger.info(f'Waiting for {name}...')
-    start = time.time()
-    while time.time() - start < timeout:
-        try:
-            if requests.get(url, timeout=5).status_code == 200:
-                logger.info(f'{name} ready')
-                return True
-        except:
-            pass
-        time.sleep(1)
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += f'?{parts.query}'
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    # One keep-alive connection for every attempt; it reopens itself after close()
+    conn = connection_class(parts.hostname, parts.port, timeout=2)
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    try:
+        while time.monotonic() < deadline:
+            try:
+                if conn.sock is not None or _port_open(url):
+                    conn.request('GET', path)
+                    response = conn.getresponse()
+                    response.read()  # Drain the body so the connection can be reused
+                    if 200 <= response.status < 300:
+                        logger.info(f'{name} ready')
+                        return True
+            except (OSError, http.client.HTTPException):
+                conn.close()
+            time.sleep(min(2.0, 0.25 * 2 ** attempt))
+            attempt += 1
+    finally:
+        conn.close()
     logger.error(f'{name} not ready')
     return False
 
 def start_xvfb():
     global xvfb_process
     logger.info('Starting Xvfb...')
-    xvfb_process = subprocess.Popen([
+    xvfb_process = _spawn([
         'Xvfb', ':99',
         '-screen', '0', f'{DISPLAY_WIDTH}x{DISPLAY_HEIGHT}x24',
         '-ac', '+extension', 'GLX', '+render', '-noreset'
     ])
-    time.sleep(1)
+    _pin_process(xvfb_process, CAPTURE_CPUS)
+    # Xvfb is ready once its socket exists
+    for _ in range(250):
+        if os.path.exists('/tmp/.X11-unix/X99'):
+            break
+        time.sleep(0.02)
+
+class _LogMultiplexer:
+    """One thread drains every child output pipe and passes complete lines to a callback"""
+    
+    def __init__(self):
+        self._sel = selectors.DefaultSelector()
+        self._thread = None
+    
+    def register(self, stream, on_line):
+        self._sel.register(stream.fileno(), selectors.EVENT_READ, [stream, on_line, b''])
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+    
+    def _loop(self):
+        while True:
+            for key, _ in self._sel.select(timeout=1):
+                stream, on_line, buf = key.data
+                try:
+                    data = os.read(key.fd, 65536)
+                except OSError:
+                    data = b''
+                if not data:
+                    self._sel.unregister(key.fd)
+                    stream.close()
+                    continue
+                *lines, key.data[2] = (buf + data).split(b'\n')
+                for line in lines:
+                    try:
+                        on_line(line)
+                    except Exception as e:
+                        logger.warning(f'Log handler failed: {e}')
+
+_log_mux = _LogMultiplexer()
+
+# Child output worth surfacing at INFO; everything else is only logged at DEBUG
+_INTERESTING = re.compile(rb'\b(?:errors?|fail(?:ed|ure)?|warn(?:ing)?|https?|unresponsive)\b', re.I)
 
 def start_puppeteer():
     global puppeteer_process
@@ -141,24 +355,94 @@ def start_puppeteer():
         return False
     
     logger.info('Starting Puppeteer...')
+    use_gpu = VIEWER_GPU and os.path.exists(VAAPI_DEVICE)
+    if VIEWER_GPU and not use_gpu:
+        logger.warning(f'VIEWER_GPU set but {VAAPI_DEVICE} not found - using software rendering')
     try:
-        puppeteer_process = subprocess.Popen(
+        puppeteer_process = _spawn(
             ['node', '/app/capture-viewer.js'],
-            env={**os.environ, 'DISPLAY': ':99'},
+            start_new_session=True,  # Own process group, so Chromium's helpers can be killed with it
+            env={**os.environ, 'DISPLAY': ':99', 'CAPTURE_METHOD': CAPTURE_METHOD,
+                 'VIEWER_GPU': 'true' if use_gpu else 'false'},
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+            stderr=subprocess.PIPE
         )
-        time.sleep(1)
+        _pin_process(puppeteer_process, CAPTURE_CPUS)
+        
+        # capture-viewer.js prints READY once the viewer page has loaded
+        ready = threading.Event()
+        
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
+        def on_line(line):
+            msg = line.strip()
+            if msg == b'READY':
+                ready.set()
+                logger.info('Puppeteer: viewer ready')
+            elif msg and _INTERESTING.search(msg):
+                logger.info(f'Puppeteer: {msg.decode(errors="replace")}')
+            elif msg and debug:
+                logger.debug(f'Puppeteer: {msg.decode(errors="replace")}')
+        
+        # In screencast mode stdout carries video frames and is handed to FFmpeg
+        if not SCREENCAST:
+            _log_mux.register(puppeteer_process.stdout, on_line)
+        _log_mux.register(puppeteer_process.stderr, on_line)
+        
+        start = time.time()
+        while not ready.wait(0.5):
+            if puppeteer_process.poll() is not None or time.time() - start > 90:
+                logger.warning('Viewer page did not report ready')
+                break
         return True
     except Exception as e:
         logger.error(f'Puppeteer failed: {e}')
         return False
 
+def _process_group_alive(pgid):
+    # As PID 1 the service inherits Chromium processes orphaned by node; reap the
+    # group's zombies first or they keep it alive
+    puppeteer_process.poll()
+    try:
+        while os.waitpid(-pgid, os.WNOHANG)[0]:
+            pass
+    except ChildProcessError:
+        pass
+    try:
+        os.killpg(pgid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+
+def stop_puppeteer():
+    """Stop node and every Chromium process it started, including ones orphaned by a crash.
+    Waits for the whole group, so a restart can't mistake the old browser's window for the new one."""
+    if not puppeteer_process:
+        return
+    pgid = puppeteer_process.pid
+    try:
+        os.killpg(pgid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    deadline = time.monotonic() + 5
+    killed = False
+    while _process_group_alive(pgid):
+        if time.monotonic() >= deadline:
+            if killed:
+                logger.warning('Puppeteer processes still running after SIGKILL')
+                return
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            killed = True
+            deadline = time.monotonic() + 2
+        time.sleep(0.1)
+
 def get_music_files():
     if not ENABLE_MUSIC:
         return None
-    music_path = Path(MUSIC_DIR)
+    music_path = Path(MUSIC_DIR).resolve()  # Globbed paths are then already absolute
     if not music_path.exists():
         return None
     files = list(music_path.glob('*.ogg')) + list(music_path.glob('*.mp3'))
@@ -171,46 +455,181 @@ def create_playlist(files):
     if not files:
         return None
     playlist = Path('/tmp/music_playlist.txt')
-    with open(playlist, 'w') as f:
-        for file in files:
-            f.write(f"file '{file.resolve()}'\n")
+    # One write of the whole list; quotes in names are escaped for the concat demuxer
+    playlist.write_bytes(b''.join(
+        b"file '%s'\n" % os.fsencode(file).replace(b"'", b"'\\''") for file in files
+    ))
     return str(playlist)
 
-def check_vaapi():
-    if not USE_HARDWARE_ENCODING or not os.path.exists(VAAPI_DEVICE):
+def has_nvidia_gpu():
+    return (os.path.exists(NVIDIA_DEVICE) or os.path.exists('/proc/driver/nvidia')
+            or shutil.which('nvidia-smi') is not None)
+
+def check_nvenc():
+    if not USE_HARDWARE_ENCODING or not has_nvidia_gpu():
         return False
     try:
         result = subprocess.run(
-            ['ffmpeg', '-hide_banner', '-init_hw_device', f'vaapi=va:{VAAPI_DEVICE}', 
-             '-f', 'lavfi', '-i', 'nullsrc', '-t', '0.1', '-f', 'null', '-'],
-            capture_output=True, timeout=10
+            ['ffmpeg', '-hide_banner', '-f', 'lavfi', '-i', 'nullsrc', '-t', '0.1',
+             '-c:v', 'h264_nvenc', '-f', 'null', '-'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10
         )
         if result.returncode == 0:
-            logger.info('VAAPI available')
+            logger.info('NVENC available')
             return True
     except:
         pass
-    logger.info('Using software encoding')
     return False
 
+def _vaapi_test_encode(device, extra_args=()):
+    try:
+        result = subprocess.run(
+            # Encode a frame, not just open the device: some render nodes can't encode H.264
+            ['ffmpeg', '-hide_banner', '-init_hw_device', f'vaapi=va:{device}', '-filter_hw_device', 'va',
+             '-f', 'lavfi', '-i', 'nullsrc=s=256x256', '-vf', 'format=nv12,hwupload',
+             '-c:v', 'h264_vaapi', *extra_args, '-frames:v', '1', '-f', 'null', '-'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10
+        )
+        return result.returncode == 0
+    except:
+        return False
+
+@functools.lru_cache(maxsize=None)
+def check_vaapi(device=VAAPI_DEVICE):
+    if not USE_HARDWARE_ENCODING or not os.path.exists(device):
+        return False
+    if _vaapi_test_encode(device):
+        logger.info(f'VAAPI available on {device}')
+        return True
+    return False
+
+def check_vaapi_low_power(device):
+    """Intel's VDEnc (low-power) encoder is faster and cheaper than the VME path, but
+    not every SKU has it or supports our rate control on it"""
+    rate_control = () if USE_HLS else ('-rc_mode', 'CBR', '-b:v', '1M')
+    if _vaapi_test_encode(device, ('-low_power', '1', *rate_control)):
+        logger.info('VAAPI low-power encoding available')
+        return True
+    return False
+
+_encoder = None
+_vaapi_low_power = False
+
+def detect_encoder():
+    """Pick the best available H.264 encoder: NVENC, then VAAPI (Intel/AMD), then libx264.
+    Probed once per process; FFmpeg restarts reuse the result."""
+    global _encoder
+    if _encoder is None:
+        _encoder = _probe_encoder()
+    return _encoder
+
+def _probe_encoder():
+    global _vaapi_low_power
+    if check_nvenc():
+        return 'nvenc', None
+    for device in dict.fromkeys([VAAPI_DEVICE, AMD_VAAPI_DEVICE]):
+        if check_vaapi(device):
+            _vaapi_low_power = check_vaapi_low_power(device)
+            return 'vaapi', device
+    logger.info('Using software encoding')
+    return 'software', None
+
+_aac_encoder = None
+
+def detect_aac_encoder():
+    """Prefer libfdk_aac over FFmpeg's native AAC encoder; probed once per process"""
+    global _aac_encoder
+    if _aac_encoder is None:
+        _aac_encoder = 'aac'
+        try:
+            out = subprocess.check_output(
+                ['ffmpeg', '-hide_banner', '-encoders'],
+                stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10
+            )
+            if b' libfdk_aac ' in out:
+                _aac_encoder = 'libfdk_aac'
+        except:
+            pass
+        logger.info(f'Audio encoder: {_aac_encoder}')
+    return _aac_encoder
+
+def _nvenc_args(keyframe, hls):
+    return [
+        '-c:v', 'h264_nvenc', '-profile:v', 'high',
+        '-preset', 'p1', '-tune', 'ull', '-rc', 'cbr', '-zerolatency', '1', '-delay', '0', '-bf', '0',
+        '-b:v', YOUTUBE_VIDEO_BITRATE, '-maxrate', YOUTUBE_MAXRATE, '-bufsize', YOUTUBE_BUFSIZE,
+        '-g', str(keyframe)
+    ]
+
+def _vaapi_args(keyframe, hls):
+    args = ['-c:v', 'h264_vaapi', '-profile:v', 'main', '-level', '4.0']
+    if _vaapi_low_power:
+        args += ['-low_power', '1']
+    if hls:
+        args += ['-qp', '23']
+    else:
+        args += ['-rc_mode', 'CBR', '-b:v', YOUTUBE_VIDEO_BITRATE, '-maxrate', YOUTUBE_MAXRATE,
+                 '-bufsize', YOUTUBE_BUFSIZE]
+    return args + ['-bf', '0', '-g', str(keyframe)]
+
+def _x264_args(keyframe, hls):
+    if hls:
+        # Segments are uploaded every few seconds anyway, so spend the latency on
+        # B-frames for quality instead of zerolatency
+        args = [
+            '-c:v', 'libx264', '-profile:v', 'main', '-level:v', '4.0',
+            '-preset', ENCODER_PRESET,
+            '-minrate', YOUTUBE_VIDEO_BITRATE, '-b:v', YOUTUBE_VIDEO_BITRATE,
+            '-maxrate', YOUTUBE_MAXRATE, '-bufsize', YOUTUBE_BUFSIZE,
+            '-bf', '3'
+        ]
+        x264_params = ['nal-hrd=cbr', 'filler=1', 'b-adapt=1']
+    else:
+        args = [
+            '-c:v', 'libx264', '-profile:v', 'high', '-level:v', '4.1',
+            '-preset', ENCODER_PRESET, '-tune', 'zerolatency',
+            '-b:v', YOUTUBE_VIDEO_BITRATE, '-maxrate', YOUTUBE_MAXRATE, '-bufsize', YOUTUBE_BUFSIZE,
+            '-bf', '0', '-refs', '1'
+        ]
+        x264_params = []
+    # One thread per core FFmpeg may run on (its pinned cores, else the container's
+    # affinity mask) instead of 1.5x the host's cores, which overcommits under a CPU quota.
+    # Capped like x264's own auto count, since an explicit -threads bypasses that cap.
+    encoder_cpus = ENCODER_CPUS or _cpus
+    if encoder_cpus:
+        args += ['-threads', str(min(len(encoder_cpus), 16))]
+        if hls:
+            # Without zerolatency x264 already uses frame threads, which keep the cores
+            # busy; RTMP keeps the sliced threads zerolatency picks
+            x264_params.append('lookahead-threads=1')
+    if x264_params:
+        args += ['-x264-params', ':'.join(x264_params)]
+    # Keyframes pinned to the wall-clock GOP boundary; scene-cut detection stays on
+    gop_seconds = keyframe / YOUTUBE_FRAMERATE
+    return args + ['-g', str(keyframe), '-force_key_frames', f'expr:gte(t,n_forced*{gop_seconds:g})']
+
+VIDEO_ENCODERS = {
+    'nvenc': _nvenc_args,
+    'vaapi': _vaapi_args,
+    'software': _x264_args,
+}
+
+def _hw_init_args(encoder, device):
+    if encoder == 'vaapi':
+        return ['-init_hw_device', f'vaapi=va:{device}', '-filter_hw_device', 'va']
+    return []
+
 def build_overlay_filter():
     if not ENABLE_OVERLAY:
         return None
     
-    positions = {
-        'top-left': 'x=30:y=30',
-        'top-right': 'x=w-tw-30:y=30',
-        'bottom-left': 'x=30:y=h-th-30',
-        'bottom-right': 'x=w-tw-30:y=h-th-30',
-    }
-    pos = positions.get(OVERLAY_POSITION, positions['top-left'])
-    
     # Ensure target file exists with initial content
     try:
         os.makedirs(os.path.dirname(TARGET_FILE), exist_ok=True)
-        if not os.path.exists(TARGET_FILE):
-            with open(TARGET_FILE, 'w') as f:
-                f.write('Starting...')
+        with open(TARGET_FILE, 'x') as f:
+            f.write('Starting...')
+    except FileExistsError:
+        pass
     except Exception as e:
         logger.warning(f'Could not create overlay file: {e}')
         return None
@@ -218,10 +637,7 @@ def build_overlay_filter():
     # Large, visible overlay with contrasting colors
     # Using default font (no fontfile needed), large size, high contrast
     font_size = OVERLAY_FONT_SIZE * 2  # Double size for visibility
-    return (
-        f"drawtext="
-        f"textfile='{TARGET_FILE}':"
-        f"reload=1:"
+    style = (
         f"fontsize={font_size}:"
         f"fontcolor=yellow:"
         f"shadowcolor=black:"
@@ -230,170 +646,303 @@ def build_overlay_filter():
         f"box=1:"
         f"boxcolor=black@0.8:"
         f"boxborderw=15:"
-        f"{pos}"
+        f"{OVERLAY_XY}"
     )
+    if use_overlay_zmq():
+        # Text arrives from push_overlay_text(); the placeholder only shows until the first push
+        # Escaped twice: once for the filtergraph parser, once for the filter's option parser
+        bind_address = OVERLAY_ZMQ_ADDRESS.replace(':', '\\\\:')
+        return f"zmq=bind_address={bind_address},drawtext@overlay=text=Loading:expansion=none:{style}"
+    return f"drawtext=textfile='{TARGET_FILE}':reload=1:{style}"
 
-def start_stream():
-    global ffmpeg_process
-    
-    if not wait_for_service(SPECTATOR_URL, 'Viewer'):
-        return False
-    
-    if not wait_for_x_windows(90):
-        logger.error('No X windows')
-        return False
-    
-    logger.info(f'Starting stream to {STREAM_PLATFORM}...')
-    
-    use_vaapi = check_vaapi()
+_overlay_zmq = None
+
+def use_overlay_zmq():
+    """zmq updates need pyzmq here and an FFmpeg built with the zmq filter"""
+    global _overlay_zmq
+    if _overlay_zmq is None:
+        _overlay_zmq = False
+        if zmq is not None:
+            try:
+                out = subprocess.check_output(
+                    ['ffmpeg', '-hide_banner', '-filters'],
+                    stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10
+                )
+                _overlay_zmq = b' zmq ' in out
+            except:
+                pass
+        logger.info(f'Overlay updates via {"zmq" if _overlay_zmq else "textfile reload"}')
+    return _overlay_zmq
+
+def _quote_option(value):
+    """Quote a value for an FFmpeg option string (the argument of a filter command)"""
+    return "'" + value.replace("'", "'\\''") + "'"
+
+def _overlay_command(text):
+    """zmq command setting the overlay text. The argument is unescaped twice: by the zmq
+    filter's tokenizer, then by drawtext's option parser, where ':' separates options"""
+    value = re.sub(r"([\\':])", r'\\\1', text)
+    return f'drawtext@overlay reinit {_quote_option("text=" + value)}'
+
+def push_overlay_text():
+    """Send the overlay text to drawtext whenever the bot changes it or FFmpeg restarts,
+    instead of drawtext stat()ing and re-reading the file on every frame"""
+    context = zmq.Context.instance()
+    sock = None
+    pushed = None
+    while True:
+        try:
+            state = (ffmpeg_started, os.stat(TARGET_FILE).st_mtime_ns)
+        except OSError:
+            state = None
+        if ffmpeg_process and state and state != pushed:
+            try:
+                text = Path(TARGET_FILE).read_text().strip() or ' '
+                if sock is None:
+                    sock = context.socket(zmq.REQ)
+                    sock.setsockopt(zmq.LINGER, 0)
+                    sock.setsockopt(zmq.SNDTIMEO, 1000)
+                    sock.setsockopt(zmq.RCVTIMEO, 1000)
+                    sock.connect(OVERLAY_ZMQ_ADDRESS)
+                sock.send_string(_overlay_command(text))
+                reply = sock.recv_string()
+                pushed = state  # A rejected text is reported once, not retried every second
+                if not reply.startswith('0 '):
+                    logger.warning(f'Overlay update rejected: {reply}')
+            except Exception as e:
+                # A REQ socket can't recover from a failed send or missed reply, so start over
+                if not isinstance(e, zmq.Again):  # Again: FFmpeg still starting (or gone)
+                    logger.warning(f'Overlay update failed: {e}')
+                if sock is not None:
+                    sock.close()
+                    sock = None
+        time.sleep(1)
+
+def resolve_ingest_host():
+    """Resolve the ingest host before FFmpeg starts so DNS problems show up in our log"""
+    url = urlsplit(STREAM_URL)
+    port = url.port or (1935 if url.scheme == 'rtmp' else 443)
+    try:
+        addr = socket.getaddrinfo(url.hostname, port, type=socket.SOCK_STREAM)[0][4][0]
+        logger.info(f'Ingest {url.hostname} -> {addr}')
+    except socket.gaierror as e:
+        logger.warning(f'Could not resolve {url.hostname}: {e}')
+
+# Live inputs: no demuxer buffering or stream probing, so the first frame goes straight to the encoder
+LIVE_INPUT_ARGS = [
+    '-thread_queue_size', '1024',
+    '-fflags', 'nobuffer', '-flags', 'low_delay',
+    '-probesize', '32', '-analyzeduration', '0'
+]
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """FFmpeg arguments that only depend on hardware and config, resolved once per process"""
+    hw_init_args: tuple
+    video_input_args: tuple
+    video_filter: str
+    video_encode_args: tuple
+    audio_encode_args: tuple
+
+_profile = None
+
+def get_encoder_profile():
+    global _profile
+    if _profile is None:
+        _profile = _build_encoder_profile()
+    return _profile
+
+def _build_encoder_profile():
+    encoder, device = detect_encoder()
     
     # Build video filter
-    filters = [f'scale={YOUTUBE_OUTPUT_WIDTH}:{YOUTUBE_OUTPUT_HEIGHT}']
+    filters = []
+    if SCREENCAST:
+        # Chromium only sends a frame when the page repaints; resample to a constant rate
+        filters.append(f'fps={YOUTUBE_FRAMERATE}')
+    if encoder != 'vaapi':
+        filters.append(f'scale={YOUTUBE_OUTPUT_WIDTH}:{YOUTUBE_OUTPUT_HEIGHT}')
     overlay = build_overlay_filter()
     if overlay:
         filters.append(overlay)
     
-    if use_vaapi:
-        filters.extend(['format=nv12', 'hwupload'])
+    if encoder == 'vaapi':
+        if SCREENCAST:
+            filters.append('format=nv12')  # JPEG decodes to yuvj420p, which VAAPI can't upload
+        # Upload at capture size; resize and NV12 conversion both run on the GPU
+        filters.extend([
+            'hwupload',
+            f'scale_vaapi=w={YOUTUBE_OUTPUT_WIDTH}:h={YOUTUBE_OUTPUT_HEIGHT}:format=nv12'
+        ])
     else:
-        filters.append('format=yuv420p')
+        # NV12 is native for NVENC and accepted directly by libx264 (still 4:2:0 8-bit)
+        filters.append('format=nv12')
     
     filter_str = ','.join(filters)
     
     # Video input
-    video_input = [
-        '-f', 'x11grab',
-        '-video_size', f'{DISPLAY_WIDTH}x{DISPLAY_HEIGHT}',
-        '-framerate', str(YOUTUBE_FRAMERATE),
-        '-draw_mouse', '0',
-        '-i', ':99.0'
-    ]
-    
-    # Build command
-    if YOUTUBE_INGEST_METHOD == 'hls' and STREAM_PLATFORM == 'youtube':
-        return _start_hls(video_input, filter_str, use_vaapi)
-    return _start_rtmp(video_input, filter_str, use_vaapi)
-
-def _start_hls(video_input, filter_str, use_vaapi):
-    global ffmpeg_process
-    
-    if STREAM_URL.endswith('file='):
-        master_url = f"{STREAM_URL}master.m3u8"
-        segment_url = f"{STREAM_URL}segment_%06d.ts"
-    else:
-        master_url = STREAM_URL
-        segment_url = master_url.replace('file=master.m3u8', 'file=segment_%06d.ts')
-    
-    cmd = ['ffmpeg', '-hide_banner']
-    
-    if use_vaapi:
-        cmd += ['-init_hw_device', f'vaapi=va:{VAAPI_DEVICE}', '-filter_hw_device', 'va']
-    
-    cmd += video_input
-    
-    # Audio
-    music_files = get_music_files()
-    playlist = create_playlist(music_files)
-    using_music = playlist is not None
-    
-    if using_music:
-        cmd += ['-f', 'concat', '-safe', '0', '-stream_loop', '-1', '-i', playlist]
-    else:
-        cmd += ['-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=44100']
-    
-    keyframe = YOUTUBE_FRAMERATE * 2
-    
-    cmd += ['-vf', filter_str]
-    
-    if use_vaapi:
-        cmd += ['-c:v', 'h264_vaapi', '-profile:v', 'main', '-level', '4.0', '-qp', '23', '-bf', '2', '-g', str(keyframe)]
-    else:
-        cmd += [
-            '-c:v', 'libx264', '-profile:v', 'main', '-level:v', '4.0',
-            '-preset', ENCODER_PRESET, '-tune', 'zerolatency',
-            '-minrate', YOUTUBE_VIDEO_BITRATE, '-b:v', YOUTUBE_VIDEO_BITRATE,
-            '-maxrate', YOUTUBE_MAXRATE, '-bufsize', YOUTUBE_BUFSIZE,
-            '-x264-params', 'nal-hrd=cbr:filler=1:force-cfr=1',
-            '-g', str(keyframe), '-keyint_min', str(keyframe), '-sc_threshold', '0',
-            '-pix_fmt', 'yuv420p'
-        ]
-    
-    if using_music:
-        cmd += ['-filter_complex', f'[1:a]volume={MUSIC_VOLUME}[music]', '-map', '0:v', '-map', '[music]']
+    if SCREENCAST:
+        video_input = (
+            *LIVE_INPUT_ARGS,
+            '-f', 'image2pipe', '-c:v', 'mjpeg',
+            '-use_wallclock_as_timestamps', '1',
+            '-i', 'pipe:0'
+        )
     else:
-        cmd += ['-map', '0:v', '-map', '1:a']
+        video_input = (
+            *LIVE_INPUT_ARGS,
+            '-f', 'x11grab',
+            '-video_size', f'{DISPLAY_WIDTH}x{DISPLAY_HEIGHT}',
+            '-framerate', str(YOUTUBE_FRAMERATE),
+            '-draw_mouse', '0',
+            '-i', ':99.0'
+        )
     
-    cmd += ['-c:a', 'aac', '-b:a', '128k', '-ar', '44100', '-ac', '2']
+    keyframe = YOUTUBE_FRAMERATE  # 1s GOP keeps encoder-induced latency low
     
-    cmd += [
-        '-fflags', '+genpts', '-flags', '+global_header',
-        '-hls_time', '4', '-hls_init_time', '4', '-hls_list_size', '5',
-        '-hls_flags', 'independent_segments+omit_endlist',
-        '-hls_segment_type', 'mpegts', '-hls_segment_filename', segment_url,
-        '-http_persistent', '1', '-method', YOUTUBE_HLS_HTTP_METHOD,
-        '-f', 'hls', master_url
-    ]
+    aac = detect_aac_encoder()
+    # The native encoder's default two-loop search is far slower than its fast coder
+    audio_codec = ('-c:a', 'aac', '-aac_coder', 'fast') if aac == 'aac' else ('-c:a', aac)
     
-    return _run_ffmpeg(cmd)
+    return EncoderProfile(
+        hw_init_args=tuple(_hw_init_args(encoder, device)),
+        video_input_args=video_input,
+        video_filter=filter_str,
+        video_encode_args=tuple(VIDEO_ENCODERS[encoder](keyframe, hls=USE_HLS)),
+        audio_encode_args=(*audio_codec, '-b:a', '128k', '-ar', '48000', '-ac', '2'),
+    )
 
-def _start_rtmp(video_input, filter_str, use_vaapi):
+def start_stream():
     global ffmpeg_process
     
-    cmd = ['ffmpeg', '-hide_banner']
-    
-    if use_vaapi:
-        cmd += ['-init_hw_device', f'vaapi=va:{VAAPI_DEVICE}', '-filter_hw_device', 'va']
-    
-    cmd += video_input
-    
-    music_files = get_music_files()
-    playlist = create_playlist(music_files)
-    using_music = playlist is not None
-    
-    if using_music:
-        cmd += ['-f', 'concat', '-safe', '0', '-stream_loop', '-1', '-i', playlist]
-    else:
-        cmd += ['-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=44100']
+    if not wait_for_service(SPECTATOR_URL, 'Viewer'):
+        return False
     
-    keyframe = YOUTUBE_FRAMERATE * 2
+    if not SCREENCAST and not wait_for_x_windows(90):
+        logger.error('No X windows')
+        return False
     
-    cmd += ['-vf', filter_str]
+    logger.info(f'Starting stream to {STREAM_PLATFORM}...')
+    resolve_ingest_host()
     
-    if use_vaapi:
-        cmd += ['-c:v', 'h264_vaapi', '-profile:v', 'main', '-level', '4.0',
-                '-b:v', YOUTUBE_VIDEO_BITRATE, '-maxrate', YOUTUBE_MAXRATE,
-                '-bufsize', YOUTUBE_BUFSIZE, '-bf', '2', '-g', str(keyframe)]
-    else:
-        cmd += [
-            '-c:v', 'libx264', '-profile:v', 'high', '-level:v', '4.1',
-            '-preset', ENCODER_PRESET, '-tune', 'zerolatency',
-            '-b:v', YOUTUBE_VIDEO_BITRATE, '-maxrate', YOUTUBE_MAXRATE, '-bufsize', YOUTUBE_BUFSIZE,
-            '-g', str(keyframe), '-keyint_min', str(keyframe), '-sc_threshold', '0',
-            '-pix_fmt', 'yuv420p'
+    return _run_ffmpeg(build_ffmpeg_cmd(get_encoder_profile()))
+
+SILENT_AUDIO_INPUT = (*LIVE_INPUT_ARGS, '-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=48000')
+MUSIC_FILTER = ('-af', f'volume={MUSIC_VOLUME}')
+STREAM_MAP = ('-map', '0:v', '-map', '1:a')
+
+def audio_input_args():
+    """Music playlist (with its volume filter) or a silent track when there is no music"""
+    playlist = create_playlist(get_music_files())
+    if playlist:
+        return (
+            ('-thread_queue_size', '1024', '-f', 'concat', '-safe', '0', '-stream_loop', '-1', '-i', playlist),
+            MUSIC_FILTER
+        )
+    return SILENT_AUDIO_INPUT, ()
+
+def _output_args():
+    if USE_HLS:
+        if STREAM_URL.endswith('file='):
+            master_url = f"{STREAM_URL}master.m3u8"
+            segment_url = f"{STREAM_URL}segment_%06d.ts"
+        else:
+            master_url = STREAM_URL
+            segment_url = master_url.replace('file=master.m3u8', 'file=segment_%06d.ts')
+        return [
+            '-fflags', '+genpts', '-flags', '+global_header',
+            '-hls_time', '2', '-hls_init_time', '2', '-hls_list_size', '3',
+            '-hls_flags', 'independent_segments+omit_endlist+program_date_time',
+            '-hls_allow_cache', '0',
+            '-hls_segment_type', 'mpegts', '-hls_segment_filename', segment_url,
+            '-http_persistent', '1', '-method', YOUTUBE_HLS_HTTP_METHOD,
+            '-ignore_io_errors', '1',  # Keep encoding through failed segment uploads
+            '-f', 'hls', master_url
         ]
+    # Fail fast on a stalled ingest so the supervisor can restart promptly
+    # tcp_nodelay is passed as an option: a ?query on an RTMP URL would become part of the stream key
+    return ['-flvflags', 'no_duration_filesize', '-rw_timeout', '10000000', '-tcp_nodelay', '1',
+            '-f', 'flv', STREAM_URL]
+
+# Everything except the music playlist is fixed for the life of the process
+OUTPUT_ARGS = tuple(_output_args())
+
+def _music_dir_stamp():
+    """Changes whenever a file is added, removed or renamed in MUSIC_DIR"""
+    if not ENABLE_MUSIC:
+        return None
+    try:
+        return os.stat(MUSIC_DIR).st_mtime_ns
+    except OSError:
+        return None
+
+# Last assembled command: restarts only copy it, unless the encoder profile changed or
+# the music directory was modified (one stat instead of a rescan and playlist rewrite)
+_ffmpeg_cmd_key = None
+_ffmpeg_cmd = ()
+
+def build_ffmpeg_cmd(profile):
+    global _ffmpeg_cmd_key, _ffmpeg_cmd
+    key = (profile, _music_dir_stamp())
+    if key != _ffmpeg_cmd_key:
+        _ffmpeg_cmd = _assemble_ffmpeg_cmd(profile)
+        _ffmpeg_cmd_key = key
+    return list(_ffmpeg_cmd)
+
+def _compose(*parts):
+    return tuple(itertools.chain.from_iterable(parts))
+
+def _assemble_ffmpeg_cmd(profile):
+    audio_input, audio_filter = audio_input_args()
+    return _compose(
+        ('ffmpeg',), FFMPEG_GLOBAL_ARGS,
+        profile.hw_init_args,
+        profile.video_input_args,
+        audio_input,
+        ('-vf', profile.video_filter),
+        profile.video_encode_args,
+        STREAM_MAP,
+        audio_filter,
+        profile.audio_encode_args,
+        OUTPUT_ARGS,
+    )
+
+def _ffmpeg_progress_logger():
+    """-progress pipe:1 writes key=value blocks terminated by progress=..."""
+    progress = {}
     
-    if using_music:
-        cmd += ['-filter_complex', f'[1:a]volume={MUSIC_VOLUME}[music]', '-map', '0:v', '-map', '[music]']
-    else:
-        cmd += ['-map', '0:v', '-map', '1:a']
-    
-    cmd += ['-c:a', 'aac', '-b:a', '128k', '-ar', '44100', '-ac', '2', '-f', 'flv', STREAM_URL]
+    def on_line(line):
+        # Only the fields that get logged are kept; values stay bytes until a block is logged
+        key, _, value = line.strip().partition(b'=')
+        if key in (b'frame', b'fps', b'speed'):
+            progress[key] = value
+        elif key == b'progress' and logger.isEnabledFor(logging.INFO):
+            logger.info(
+                f"FFmpeg: frame={progress.get(b'frame', b'?').decode()} "
+                f"fps={progress.get(b'fps', b'?').decode()} "
+                f"speed={progress.get(b'speed', b'?').decode()}"
+            )
+            progress.clear()
     
-    return _run_ffmpeg(cmd)
+    return on_line
 
 def _run_ffmpeg(cmd):
-    global ffmpeg_process
+    global ffmpeg_process, ffmpeg_started
     try:
-        logger.info(f'FFmpeg: {" ".join(cmd[:20])}...')
-        ffmpeg_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        def monitor():
-            for line in ffmpeg_process.stderr:
-                msg = line.strip()
-                if any(kw in msg.lower() for kw in ['error', 'failed', 'warning']):
-                    logger.info(f'FFmpeg: {msg}')
-        
-        threading.Thread(target=monitor, daemon=True).start()
+        logger.info(f'FFmpeg: {shlex.join(cmd[:20])}...')
+        # Screencast frames are read from Puppeteer's stdout; the service keeps its
+        # own copy of the pipe so FFmpeg can be restarted without restarting Chromium
+        stdin = puppeteer_process.stdout if SCREENCAST and puppeteer_process else None
+        if LOG_FFMPEG:
+            # Verbose output goes straight to a file; only progress passes through Python
+            with open(log_dir / 'ffmpeg.log', 'ab') as ffmpeg_log:
+                ffmpeg_process = _spawn(cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=ffmpeg_log)
+            _log_mux.register(ffmpeg_process.stdout, _ffmpeg_progress_logger())
+        else:
+            # Errors go straight to the container's stderr without a reader thread
+            ffmpeg_process = _spawn(cmd, stdin=stdin, stdout=subprocess.DEVNULL)
+        ffmpeg_started = time.monotonic()
+        _pin_process(ffmpeg_process, ENCODER_CPUS, realtime=True)
         logger.info('Stream started')
         return True
     except Exception as e:
@@ -402,7 +951,8 @@ def _run_ffmpeg(cmd):
 
 def cleanup():
     logger.info('Cleaning up...')
-    for proc in [ffmpeg_process, puppeteer_process, xvfb_process]:
+    stop_puppeteer()
+    for proc in [ffmpeg_process, xvfb_process]:
         if proc:
             proc.terminate()
             try:
@@ -417,6 +967,21 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
+# SIGCHLD wakes the supervisor loop through a self-pipe instead of it polling
+_wakeup_r, _wakeup_w = os.pipe()
+os.set_blocking(_wakeup_w, False)
+signal.set_wakeup_fd(_wakeup_w)
+signal.signal(signal.SIGCHLD, lambda sig, frame: None)
+_wakeup_sel = selectors.DefaultSelector()
+_wakeup_sel.register(_wakeup_r, selectors.EVENT_READ)
+
+X_CHECK_INTERVAL = 30  # seconds between "browser window still mapped" checks
+
+def wait_for_child_exit(timeout):
+    """Block until a child process exits or timeout elapses"""
+    if _wakeup_sel.select(timeout):
+        os.read(_wakeup_r, 512)
+
 def is_stream_active():
     """Check if bot wants streaming to be active (players online)"""
     try:
@@ -445,7 +1010,11 @@ def main():
     logger.info('Starting streaming service...')
     logger.info(f'{STREAM_PLATFORM} @ {YOUTUBE_OUTPUT_WIDTH}x{YOUTUBE_OUTPUT_HEIGHT}@{YOUTUBE_FRAMERATE}fps')
     
-    if os.name != 'nt':
+    if SCREENCAST:
+        if not start_puppeteer():
+            cleanup()
+            sys.exit(1)
+    elif os.name != 'nt':
         start_xvfb()
         if not start_puppeteer():
             cleanup()
@@ -456,6 +1025,11 @@ def main():
                 cleanup()
                 sys.exit(1)
     
+    # Probe encoders now so the first stream start doesn't pay for it
+    get_encoder_profile()
+    if ENABLE_OVERLAY and use_overlay_zmq():
+        threading.Thread(target=push_overlay_text, daemon=True).start()
+    
     # Wait for initial stream status
     logger.info('Waiting for bot to signal stream status...')
     for _ in range(30):  # Wait up to 30 seconds
@@ -464,6 +1038,7 @@ def main():
         time.sleep(1)
     
     stream_was_active = False
+    next_x_check = time.monotonic() + X_CHECK_INTERVAL
     
     try:
         while True:
@@ -484,21 +1059,36 @@ def main():
             
             # Only do health checks if we're supposed to be streaming
             if should_stream:
+                # x11grab keeps capturing Xvfb while the browser is replaced, so FFmpeg (and
+                # the ingest session) only has to restart when it reads Puppeteer's stdout
                 if puppeteer_process and puppeteer_process.poll() is not None:
                     logger.error('Puppeteer died, restarting...')
-                    stop_ffmpeg()
-                    start_puppeteer()
-                    wait_for_x_windows(90)
-                    start_stream()
+                    stop_puppeteer()  # Chromium can outlive node
+                    if SCREENCAST:
+                        stop_ffmpeg()
+                        start_puppeteer()
+                        start_stream()
+                    else:
+                        start_puppeteer()
+                        # FFmpeg may never have started if the browser was already down
+                        if not ffmpeg_process or ffmpeg_process.poll() is not None:
+                            start_stream()
+                        else:
+                            wait_for_x_windows(90)
                 
-                if os.name != 'nt' and not _has_x_windows():
+                # A child exit wakes the loop via SIGCHLD; a vanished window has no
+                # signal, so it is only checked on a slower tick
+                check_x = time.monotonic() >= next_x_check
+                if check_x:
+                    next_x_check = time.monotonic() + X_CHECK_INTERVAL
+                if check_x and os.name != 'nt' and not SCREENCAST and not _has_x_windows():
                     logger.error('X window gone, restarting...')
-                    stop_ffmpeg()
-                    if puppeteer_process:
-                        puppeteer_process.terminate()
+                    stop_puppeteer()
                     start_puppeteer()
-                    wait_for_x_windows(90)
-                    start_stream()
+                    if not ffmpeg_process or ffmpeg_process.poll() is not None:
+                        start_stream()
+                    else:
+                        wait_for_x_windows(90)
                 
                 if ffmpeg_process and ffmpeg_process.poll() is not None:
                     logger.error('FFmpeg died, restarting...')
@@ -506,7 +1096,10 @@ def main():
                     if not start_stream():
                         break
             
-            time.sleep(5)  # Check status every 5 seconds
+            # Wake on child exit, else re-check the bot's stream status every 5 seconds.
+            # Children are polled on every pass (one waitpid each), so an exit seen
+            # while paused is still handled once streaming resumes.
+            wait_for_child_exit(5)
     except KeyboardInterrupt:
         pass
     finally:
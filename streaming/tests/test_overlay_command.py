@@ -0,0 +1,93 @@
+"""
+Overlay text sent over zmq must survive FFmpeg's two rounds of unescaping
+"""
+
+import ast
+import re
+import unittest
+from pathlib import Path
+
+SERVICE = Path(__file__).resolve().parent.parent / 'streaming-service.py'
+WHITESPACES = ' \n\t\r'
+SPACES = ' \f\t\n\r'
+
+
+def load_functions(*names):
+    """Pull single functions out of streaming-service.py without running its module setup"""
+    tree = ast.parse(SERVICE.read_text())
+    funcs = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name in names]
+    namespace = {'re': re}
+    exec(compile(ast.Module(body=funcs, type_ignores=[]), str(SERVICE), 'exec'), namespace)
+    return namespace
+
+
+def av_get_token(buf, term):
+    """Port of libavutil's av_get_token(); returns (token, rest of buf)"""
+    i = len(buf) - len(buf.lstrip(WHITESPACES))
+    out = []
+    end = 0
+    while i < len(buf) and buf[i] not in term:
+        c = buf[i]
+        i += 1
+        if c == '\\' and i < len(buf):
+            out.append(buf[i])
+            i += 1
+            end = len(out)
+        elif c == "'":
+            while i < len(buf) and buf[i] != "'":
+                out.append(buf[i])
+                i += 1
+            if i < len(buf):
+                i += 1
+                end = len(out)
+        else:
+            out.append(c)
+    while len(out) > end and out[-1] in WHITESPACES:
+        out.pop()
+    return ''.join(out), buf[i:]
+
+
+def parse_zmq_command(command):
+    """libavfilter f_zmq.c parse_command(): target, command, arg"""
+    parts = []
+    for _ in range(3):
+        token, command = av_get_token(command, SPACES)
+        parts.append(token)
+        command = command.lstrip(SPACES)
+    return parts
+
+
+def parse_options(opts):
+    """av_set_options_string(ctx, opts, "=", ":") as used by drawtext's reinit"""
+    options = {}
+    while opts:
+        key, opts = av_get_token(opts, '=')
+        if not opts.startswith('='):
+            raise ValueError(f"missing '=' after key {key!r}")
+        value, opts = av_get_token(opts[1:], ':')
+        options[key] = value
+        if opts.startswith(':'):
+            opts = opts[1:]
+    return options
+
+
+class OverlayCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.overlay_command = load_functions('_quote_option', '_overlay_command')['_overlay_command']
+
+    def assert_round_trip(self, text):
+        target, command, arg = parse_zmq_command(self.overlay_command(text))
+        self.assertEqual((target, command), ('drawtext@overlay', 'reinit'))
+        self.assertEqual(parse_options(arg), {'text': text})
+
+    def test_colon(self):
+        self.assert_round_trip('Now following: Steve')
+        self.assert_round_trip('Showcase: Spawn')
+
+    def test_quotes_and_backslashes(self):
+        self.assert_round_trip("Now following: Steve's \\ 'base'")
+        self.assert_round_trip("a:'b':\\c\\")
+
+
+if __name__ == '__main__':
+    unittest.main()